@@ -14,13 +14,21 @@ Notes:
 - Commands execute via `bash -lc` so pipes/redirection/heredocs work.
 """
 
+import asyncio
+import atexit
+import hashlib
+import io
+import math
 import os
+import pickle
+import shelve
+import socket
 import sys
+import threading
 import re
 import json
 import subprocess
 from pathlib import Path
-from textwrap import dedent
 
 # -------------------------- Config -------------------------------------------
 
@@ -44,14 +52,28 @@ RISKY_PATTERNS = [
     r"\biptables\b",
     r"\bufw\b.*\breset\b",
 ]
+# Combined into one alternation so is_risky makes a single pass through the
+# regex engine instead of one search per pattern.  Anchored to line starts and
+# command separators so the engine advances by line on multi-kB heredocs
+# instead of retrying every character; ASCII mode skips Unicode case handling.
+# /, =, and the quotes stay in the separator class so path-prefixed
+# (/bin/rm), assignment (VAR=/sbin/iptables), and quoted-wrapper
+# (bash -c "iptables -F") invocations are still caught.
+_RISKY_RE = re.compile(
+    r"(?:^|[\s;|&(`/='\"])(?:" + "|".join(f"(?:{p})" for p in RISKY_PATTERNS) + ")",
+    re.MULTILINE | re.ASCII,
+)
 
-SYSTEM_PROMPT = dedent("""
+SYSTEM_PROMPT = """
 You are an automation agent running in a linux OS.
 The user will describe a task in natural language. You must reply with JSON ONLY (no backticks, no extra prose).
 JSON schema (exact keys):
 {
   "explanation": "one short sentence explaining your plan solution or response",
-  "commands": ["bash command 1", "bash command 2", "..."]
+  "commands": ["bash command 1", "bash command 2", "..."],
+  "done_if_no_output": true if the task is complete when the commands produce no output (or "commands" is empty), false if you would need to see output first,
+  "summary": "one short sentence shown to the user when the commands produce no output",
+  "parallel_groups": optional; when every command is read-only and order-independent (pure investigation), repeat them here grouped as [["cmd 1", "cmd 2"], ["cmd 3"]]; commands within a group run concurrently, groups run in order. Omit for anything that writes state or depends on another command.
 }
 Rules:
 - Prefer idempotent commands when reasonable.
@@ -91,7 +113,60 @@ Rules:
 - Keep explanations short but informative.
 - when asked to find issues prefer responding with an answer over running commands.
 - when asked to execute tasks think one more time before running commands.
-""").strip()
+Reference recipes (follow these shapes when they fit the task):
+- Idempotent file/script creation:
+  install -d -m 0755 ~/scripts
+  cat > ~/scripts/task.sh <<'EOF'
+  #!/usr/bin/env bash
+  set -euo pipefail
+  EOF
+  chmod +x ~/scripts/task.sh
+- Idempotent package install (check before acting):
+  dpkg -s nginx >/dev/null 2>&1 || sudo apt-get install -y nginx
+- Service triage, least disruptive first:
+  systemctl status <service> --no-pager
+  journalctl -u <service> -n 100 --no-pager
+  then and only then: sudo systemctl restart <service>
+- Docker container triage:
+  docker ps --format '{{.Names}}\t{{.Status}}\t{{.Ports}}'
+  docker logs --tail 200 <container>
+  docker inspect <container> --format '{{json .State}}'
+  docker exec <container> ping -c1 <other-container>
+- Disk space triage:
+  df -h
+  sudo du -xh --max-depth=1 / 2>/dev/null | sort -h | tail -n 20
+  journalctl --disk-usage
+- DNS triage (compare default resolver against a known-good one):
+  resolvectl status
+  cat /etc/resolv.conf
+  dig +short example.com
+  dig +short example.com @8.8.8.8
+- Permission triage:
+  ls -ld <path>; namei -l <path>; id <user>
+  prefer adding the user to the owning group over chmod 777.
+- Port/connectivity triage:
+  ss -tulpn | grep <port>
+  curl -sv http://localhost:<port>/ from the host and from inside containers.
+""".strip()
+
+# Kept separate from SYSTEM_PROMPT so the first system message stays
+# byte-identical across calls and sessions: OpenAI caches identical prompt
+# prefixes (>=1024 tokens), and any host-specific bytes up front would break
+# the prefix match.  Dynamic context therefore rides in a second, trailing
+# system message.
+SYSTEM_DYNAMIC = "Host context: user={} host={} cwd={}".format(
+    os.environ.get("USER") or os.environ.get("LOGNAME") or "unknown",
+    socket.gethostname(),
+    os.getcwd(),
+)
+
+# Frozen template every session/harness run copies from, so the system prefix
+# bytes are guaranteed identical across calls (prefix-cache eligible) and the
+# prompt isn't rebuilt per run.
+BASE_MESSAGES = (
+    {"role": "system", "content": SYSTEM_PROMPT},
+    {"role": "system", "content": SYSTEM_DYNAMIC},
+)
 
 # -------------------------- OpenAI client ------------------------------------
 
@@ -112,28 +187,65 @@ client = OpenAI()  # reads OPENAI_API_KEY from env
 
 # -------------------------- Helpers ------------------------------------------
 
+# orjson parses model responses a few times faster than stdlib json and sorts
+# cache-key payloads in C; fall back silently when it is not installed.
+try:
+    import orjson
+
+    _loads = orjson.loads
+
+    def _dumps_sorted(obj) -> str:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS).decode()
+except ImportError:
+    _loads = json.loads
+
+    def _dumps_sorted(obj) -> str:
+        return json.dumps(obj, sort_keys=True)
+
+# ijson streams very large completions ("dump the logs" sessions can return
+# tens of KB) and keeps only the plan keys instead of materializing the whole
+# object at once; optional like orjson above.
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+_LARGE_RESPONSE = 4096
+_PLAN_KEYS = {"explanation", "commands", "done_if_no_output", "summary", "parallel_groups"}
+
+def _parse_plan_large(s: str) -> dict:
+    """Extract just the plan keys from a large JSON object via ijson."""
+    data = {}
+    for key, value in ijson.kvitems(io.BytesIO(s.encode()), ""):
+        if key in _PLAN_KEYS:
+            data[key] = value
+    return data
+
+# Precompiled so the hot JSON-extraction and command paths skip the re module's
+# per-call cache lookup and pattern parsing.
+_FENCE_OPEN = re.compile(r"^```[a-zA-Z]*\n")
+_FENCE_CLOSE = re.compile(r"\n```$")
+_PLACEHOLDER = re.compile(r"<[\w-]+>")
+
 def _extract_json(s: str) -> str:
     """Strip code fences if any and return first {...} block."""
     s = s.strip()
     # remove fenced blocks if present
-    s = re.sub(r"^```[a-zA-Z]*\n", "", s)
-    s = re.sub(r"\n```$", "", s)
-    # quick path
-    try:
-        json.loads(s)
+    s = _FENCE_OPEN.sub("", s)
+    s = _FENCE_CLOSE.sub("", s)
+    # quick path: most responses are already a bare JSON object
+    if s.startswith("{") and s.endswith("}"):
         return s
-    except Exception:
-        pass
-    m = re.search(r"\{.*\}", s, flags=re.S)
-    if not m:
+    # fall back to a linear scan for the outermost {...} block; find/rfind
+    # avoid the backtracking a `\{.*\}` regex would do on long outputs
+    i = s.find("{")
+    j = s.rfind("}")
+    if i < 0 or j < i:
         raise ValueError("Model did not return JSON.")
-    return m.group(0)
+    return s[i : j + 1]
 
 def is_risky(cmd: str) -> bool:
-    for pat in RISKY_PATTERNS:
-        if re.search(pat, cmd):
-            return True
-    return False
+    return _RISKY_RE.search(cmd) is not None
 
 def confirm(prompt: str) -> bool:
     try:
@@ -148,6 +260,17 @@ def _unwrap_outer_quotes(cmd: str) -> str:
         return cmd[1:-1]
     return cmd
 
+# Only decode the escapes the models actually emit; one compiled-regex pass
+# instead of three str.replace scans over potentially multi-kB heredocs.
+_ESCAPES = {"\\n": "\n", "\\t": "\t", "\\r": "\r"}
+_ESCAPE_RE = re.compile(r"\\[ntr]")
+# Trailing whitespace on every line in one multiline pass, replacing the
+# splitlines/rstrip/join round-trip (helps if a heredoc EOF has spaces).
+_TRAILING_WS_RE = re.compile(r"[ \t]+$", re.M)
+
+def _decode_escape(m) -> str:
+    return _ESCAPES[m.group(0)]
+
 def normalize_command(cmd: str) -> str:
     """
     Normalize model-emitted commands so Bash handles heredocs and newlines correctly.
@@ -155,98 +278,429 @@ def normalize_command(cmd: str) -> str:
     - Ensure heredocs end with a newline so the terminator is seen.
     - Unwrap one pair of surrounding quotes if the whole string is quoted.
     """
-    original = cmd
     cmd = _unwrap_outer_quotes(cmd)
 
     # Replace common escaped sequences with real characters.
     # Do this conservatively to avoid over-decoding arbitrary escapes.
-    cmd = cmd.replace("\\n", "\n").replace("\\t", "\t").replace("\\r", "\r")
+    cmd = _ESCAPE_RE.sub(_decode_escape, cmd)
+
+    # Trim trailing spaces on all lines at once.
+    cmd = _TRAILING_WS_RE.sub("", cmd)
 
-    # If a heredoc is present, make sure the string ends with a newline.
+    # If a heredoc is present, make sure the string ends with a newline so the
+    # terminator is seen.  Done last so the trim can't strip it back off.
     if "<<" in cmd and not cmd.endswith("\n"):
         cmd = cmd + "\n"
-
-    # Optional: trim trailing spaces on lines (helps if EOF has spaces)
-    lines = cmd.splitlines()
-    lines = [ln.rstrip() for ln in lines]
-    cmd = "\n".join(lines)
     return cmd
 
-def run_commands(commands):
-    """Run a sequence of commands in the same Bash shell so state persists."""
-    outputs = []
-    placeholder_re = re.compile(r"<[\w-]+>")
-    # Spawn a single login shell; variables persist across commands.  Some
-    # environments wipe out PATH via shell init scripts, so provide a safe
-    # default if it's missing to ensure basic utilities remain accessible.
+def _shell_env() -> dict:
+    """Environment for spawned shells.
+
+    Some environments wipe out PATH via shell init scripts, so provide a safe
+    default if it's missing to keep basic utilities accessible.
+    """
     env = os.environ.copy()
     if not env.get("PATH"):
         env["PATH"] = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
-    shell = subprocess.Popen(
-        ["bash", "-l"],
-        stdin=subprocess.PIPE,
-        stdout=subprocess.PIPE,
-        stderr=subprocess.STDOUT,
-        text=True,
-        bufsize=1,
-        env=env,
-    )
+    return env
+
+# One login shell is reused for the whole session: login init (.profile,
+# .bashrc) can take hundreds of ms on a Pi, and reusing the shell also lets
+# variables persist across planning rounds, not just within one.
+_SHELL = None
+_SHELL_LOCK = threading.Lock()
+
+def _get_shell():
+    """Return the session-wide Bash shell, (re)spawning it if it died.
+
+    Double-checked around the lock: the pre-warm thread and concurrent
+    planners may race here, and an unguarded check-then-spawn would leak a
+    bash process per loser.
+    """
+    global _SHELL
+    if _SHELL is None or _SHELL.poll() is not None:
+        with _SHELL_LOCK:
+            if _SHELL is None or _SHELL.poll() is not None:
+                _SHELL = subprocess.Popen(
+                    ["bash", "-l"],
+                    stdin=subprocess.PIPE,
+                    stdout=subprocess.PIPE,
+                    stderr=subprocess.STDOUT,
+                    bufsize=0,
+                    env=_shell_env(),
+                )
+    return _SHELL
+
+def _close_shell():
+    global _SHELL
+    if _SHELL is None:
+        return
+    try:
+        _SHELL.stdin.close()
+    except Exception:
+        pass
+    _SHELL.terminate()
+    _SHELL.wait()
+    _SHELL = None
+
+atexit.register(_close_shell)
+
+_EXIT_SENTINEL = b"__CMD_EXIT:"
+
+def _find_sentinel(buf, start):
+    """Find the sentinel at a line start (offset 0 or right after a newline).
+
+    Command output may legitimately contain the sentinel text mid-line (e.g.
+    the agent grepping its own source), so only line-initial occurrences
+    count.
+    """
+    idx = buf.find(_EXIT_SENTINEL, start)
+    while idx > 0 and buf[idx - 1] != 0x0A:
+        idx = buf.find(_EXIT_SENTINEL, idx + 1)
+    return idx
+
+def _drain_output(shell):
+    """Read shell output up to the exit sentinel, echoing lines as they arrive.
+
+    Drains in 64 KB chunks via os.read into a bytearray and locates the
+    sentinel with bytes.find, so a command printing thousands of lines costs
+    one Python iteration per chunk instead of one per line.  Returns
+    (output, exit_code).
+    """
+    fd = shell.stdout.fileno()
+    buf = bytearray()
+    printed = 0
+    scanned = 0  # offset the sentinel search resumes from
+    while True:
+        idx = _find_sentinel(buf, scanned)
+        while idx >= 0:
+            nl = buf.find(b"\n", idx)
+            if nl < 0:
+                break  # sentinel line incomplete; keep reading
+            try:
+                exit_code = int(buf[idx + len(_EXIT_SENTINEL):nl])
+            except ValueError:
+                # A line-initial lookalike without an exit code after it is
+                # ordinary output; skip past it and keep scanning.
+                scanned = nl + 1
+                idx = _find_sentinel(buf, scanned)
+                continue
+            # The newline right before the sentinel was injected by the
+            # printf wrapper in run_commands, not by the command; drop it.
+            out_end = max(idx - 1, 0)
+            if out_end > printed:
+                sys.stdout.write(buf[printed:out_end].decode(errors="replace"))
+                sys.stdout.flush()
+            return buf[:out_end].decode(errors="replace"), exit_code
+        if idx < 0:
+            # Echo finished lines now, holding back a possible partial
+            # sentinel straddling the chunk boundary at the tail.
+            limit = len(buf) - len(_EXIT_SENTINEL) + 1
+            safe = buf.rfind(b"\n", printed, max(printed, limit)) + 1
+            if safe > printed:
+                sys.stdout.write(buf[printed:safe].decode(errors="replace"))
+                sys.stdout.flush()
+                printed = safe
+            if limit > scanned:
+                scanned = limit
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            # Shell died before echoing the sentinel; flush what we have.
+            if len(buf) > printed:
+                sys.stdout.write(buf[printed:].decode(errors="replace"))
+                sys.stdout.flush()
+            return buf.decode(errors="replace"), 0
+        buf.extend(chunk)
+
+def run_commands(commands):
+    """Run a sequence of commands in the session's Bash shell so state persists."""
+    # Accumulate the transcript in one StringIO (geometric growth in C)
+    # instead of a per-command list plus join plus += concatenations.
+    transcript = io.StringIO()
+    shell = _get_shell()
+    # Loop-invariant hoisting: LOAD_FAST on these locals beats a LOAD_GLOBAL
+    # per command, and with SAFE_MODE off the risky check never runs at all.
+    _safe = SAFE_MODE
+    _is_risky = is_risky
     try:
         for raw in commands:
             cmd = normalize_command(str(raw))
-            if placeholder_re.search(cmd) and "<<" not in cmd:
+            if transcript.tell():
+                transcript.write("\n")
+            if _PLACEHOLDER.search(cmd) and "<<" not in cmd:
                 print("[Skipped placeholder]", cmd)
-                outputs.append(f"$ {cmd}\n[Skipped placeholder]")
+                transcript.write(f"$ {cmd}\n[Skipped placeholder]")
                 continue
             print("[Executing]" + (f" {cmd}" if "\n" not in raw else "\n(multiline command)"))
-            if SAFE_MODE and (cmd.startswith("sudo") or is_risky(cmd)):
+            if _safe and (cmd.startswith("sudo") or _is_risky(cmd)):
                 if not confirm("This looks privileged or risky. Run it anyway?"):
                     print("[Skipped]")
-                    outputs.append(f"$ {cmd}\n[Skipped]")
+                    transcript.write(f"$ {cmd}\n[Skipped]")
                     continue
-            # Send the command and a sentinel to capture its exit code
-            shell.stdin.write(cmd + "\n")
-            shell.stdin.write("echo __CMD_EXIT:$?\n")
+            # Send the command and a sentinel to capture its exit code.  The
+            # leading \n guarantees the sentinel starts a line even when the
+            # command's output has no trailing newline; _drain_output strips
+            # it back out.
+            shell.stdin.write((cmd + "\n").encode())
+            shell.stdin.write(b"printf '\\n__CMD_EXIT:%s\\n' $?\n")
             shell.stdin.flush()
 
-            collected = []
-            exit_code = 0
-            # Read until we see the sentinel
-            while True:
-                line = shell.stdout.readline()
-                if line == "":
-                    break
-                if line.startswith("__CMD_EXIT:"):
-                    exit_code = int(line.strip().split(":", 1)[1])
-                    break
-                print(line, end="")
-                collected.append(line)
-
-            cmd_output = f"$ {cmd}\n" + "".join(collected)
+            collected, exit_code = _drain_output(shell)
+            transcript.write(f"$ {cmd}\n")
+            transcript.write(collected)
+            if exit_code != 0:
+                error_msg = f"[Error] Command failed with code {exit_code}"
+                print(error_msg)
+                transcript.write(f"\n{error_msg}\n")
+    except BrokenPipeError:
+        # The shell died mid-plan (e.g. a command killed it); the next call to
+        # _get_shell will respawn it.
+        if transcript.tell():
+            transcript.write("\n")
+        transcript.write("[Shell exited unexpectedly]")
+    return transcript.getvalue()
+
+async def _run_one_async(cmd: str):
+    proc = await asyncio.create_subprocess_exec(
+        "bash",
+        "-lc",
+        cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=_shell_env(),
+    )
+    out, _ = await proc.communicate()
+    return cmd, out.decode(errors="replace"), proc.returncode
+
+async def _run_group_async(cmds):
+    return await asyncio.gather(*(_run_one_async(c) for c in cmds))
+
+def run_parallel_groups(groups):
+    """Run groups of independent commands concurrently, one group at a time.
+
+    Investigation commands (docker ps, ss, journalctl, ...) mostly wait on
+    I/O, so fanning a group out to separate bash processes collapses its wall
+    time to the slowest member instead of the sum.  Each command gets its own
+    shell, so the model is told to only group read-only, order-independent
+    commands here; stateful plans still go through run_commands.
+    """
+    transcript = io.StringIO()
+    for group in groups:
+        # A bare string here would be iterated character by character, each
+        # one spawning its own bash; reject the shape outright.
+        if not isinstance(group, list):
+            raise ValueError("'parallel_groups' must be a list of lists.")
+        cmds = []
+        for raw in group:
+            cmd = normalize_command(str(raw))
+            if _PLACEHOLDER.search(cmd) and "<<" not in cmd:
+                print("[Skipped placeholder]", cmd)
+                if transcript.tell():
+                    transcript.write("\n")
+                transcript.write(f"$ {cmd}\n[Skipped placeholder]")
+                continue
+            if SAFE_MODE and (cmd.startswith("sudo") or is_risky(cmd)):
+                if not confirm("This looks privileged or risky. Run it anyway?"):
+                    print("[Skipped]")
+                    if transcript.tell():
+                        transcript.write("\n")
+                    transcript.write(f"$ {cmd}\n[Skipped]")
+                    continue
+            print(f"[Executing in parallel] {cmd}" if "\n" not in cmd else "[Executing in parallel]\n(multiline command)")
+            cmds.append(cmd)
+        if not cmds:
+            continue
+        for cmd, out, exit_code in asyncio.run(_run_group_async(cmds)):
+            print(out, end="")
+            if transcript.tell():
+                transcript.write("\n")
+            transcript.write(f"$ {cmd}\n")
+            transcript.write(out)
             if exit_code != 0:
                 error_msg = f"[Error] Command failed with code {exit_code}"
                 print(error_msg)
-                cmd_output += f"\n{error_msg}\n"
-            outputs.append(cmd_output)
-    finally:
+                transcript.write(f"\n{error_msg}\n")
+    return transcript.getvalue()
+
+# Semantic plan cache.  Many admin tasks are near-duplicates ("restart nginx"
+# vs "nginx restart"); an embedding lookup is roughly 10x cheaper than a chat
+# completion, so reuse the cached plan when cosine similarity clears the
+# threshold.  Entries are (normalized embedding, content, plan) tuples kept in
+# memory and pickled for cross-session reuse.  Disable with SEMANTIC_CACHE=0.
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "1") != "0"
+EMBED_MODEL = "text-embedding-3-small"
+_SEMANTIC_THRESHOLD = 0.92
+_semantic_entries: list = []
+
+# A local sentence-transformers model (optional install) keeps cache lookups
+# off the network entirely; the OpenAI embeddings endpoint is the fallback.
+# Loaded lazily on first use.  False means "tried and unavailable".
+_LOCAL_EMBEDDER = None
+
+def _local_embedder():
+    global _LOCAL_EMBEDDER
+    if _LOCAL_EMBEDDER is None:
         try:
-            shell.stdin.close()
+            from sentence_transformers import SentenceTransformer
+
+            _LOCAL_EMBEDDER = SentenceTransformer("all-MiniLM-L6-v2")
         except Exception:
-            pass
-        shell.terminate()
-        shell.wait()
-    return "\n".join(outputs)
+            _LOCAL_EMBEDDER = False
+    return _LOCAL_EMBEDDER
 
-def plan_commands(messages: list) -> dict:
-    resp = client.chat.completions.create(
+def _semantic_path() -> Path:
+    # One cache file per backend: MiniLM and OpenAI vectors live in different
+    # embedding spaces and must never be compared against each other.
+    name = "st" if _local_embedder() else "openai"
+    return Path(f"~/.cache/ai-agent/embed-{name}.pkl").expanduser()
+
+def _embed(text: str):
+    """Return a unit-normalized embedding for text, or None on failure."""
+    model = _local_embedder()
+    if model:
+        try:
+            return model.encode(text, normalize_embeddings=True).tolist()
+        except Exception:
+            return None
+    try:
+        resp = client.embeddings.create(model=EMBED_MODEL, input=text)
+        vec = resp.data[0].embedding
+    except Exception:
+        return None
+    norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+    return [v / norm for v in vec]
+
+def _load_semantic_cache() -> None:
+    path = _semantic_path()
+    if _semantic_entries or not path.exists():
+        return
+    try:
+        with path.open("rb") as fp:
+            _semantic_entries.extend(pickle.load(fp))
+    except Exception:
+        pass
+
+def _save_semantic_cache() -> None:
+    path = _semantic_path()
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("wb") as fp:
+            pickle.dump(_semantic_entries, fp)
+    except Exception:
+        pass
+
+def _semantic_lookup(emb):
+    """Return the best (content, plan) above the similarity threshold."""
+    best = None
+    best_score = _SEMANTIC_THRESHOLD
+    for entry_emb, content, data in _semantic_entries:
+        if len(entry_emb) != len(emb):
+            continue
+        # vectors are normalized, so the dot product is the cosine similarity
+        score = sum(a * b for a, b in zip(emb, entry_emb))
+        if score > best_score:
+            best_score = score
+            best = (content, data)
+    return best
+
+# Exact-match plan cache.  With TEMPERATURE == 0 identical message histories
+# deterministically produce the same plan, so repeated tasks (common when
+# re-running scenarios or debugging) can skip the API round-trip entirely.
+# A shelve store backs the in-memory dict so hits survive across sessions;
+# prefix a task with "!" to bypass the caches and force a fresh call.
+_PLAN_CACHE: dict = {}
+_PLAN_CACHE_PATH = Path("~/.cache/ai-agent/plan_cache").expanduser()
+
+def _plan_cache_key(messages: list) -> str:
+    payload = _dumps_sorted({"model": MODEL, "t": TEMPERATURE, "msgs": messages})
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _plan_cache_get(key: str):
+    hit = _PLAN_CACHE.get(key)
+    if hit is not None:
+        return hit
+    try:
+        with shelve.open(str(_PLAN_CACHE_PATH)) as store:
+            hit = store.get(key)
+    except Exception:
+        return None
+    if hit is not None:
+        _PLAN_CACHE[key] = hit
+    return hit
+
+def _plan_cache_put(key: str, value) -> None:
+    _PLAN_CACHE[key] = value
+    try:
+        _PLAN_CACHE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        with shelve.open(str(_PLAN_CACHE_PATH)) as store:
+            store[key] = value
+    except Exception:
+        pass
+
+def plan_commands(messages: list, use_cache: bool = True) -> dict:
+    # use_cache=False (the "!" prefix) skips the lookups only; the key and
+    # embedding are still computed so the fresh plan replaces the stale
+    # cached one instead of leaving it to be served on the next call.
+    key = None
+    if TEMPERATURE == 0:
+        key = _plan_cache_key(messages)
+        if use_cache:
+            cached = _plan_cache_get(key)
+            if cached is not None:
+                content, data = cached
+                messages.append({"role": "assistant", "content": content})
+                return data
+    # Semantic lookup only applies to a fresh task (system messages + one user
+    # message); mid-task turns depend on prior command output and must not be
+    # reused.
+    emb = None
+    fresh_task = messages[-1].get("role") == "user" and all(
+        m.get("role") == "system" for m in messages[:-1]
+    )
+    if SEMANTIC_CACHE and fresh_task:
+        _load_semantic_cache()
+        emb = _embed(messages[-1]["content"])
+        if use_cache and emb is not None:
+            hit = _semantic_lookup(emb)
+            if hit is not None:
+                content, data = hit
+                messages.append({"role": "assistant", "content": content})
+                return data
+    # Pre-warm the session shell on a worker thread so its login init overlaps
+    # with model generation instead of serializing after it.
+    threading.Thread(target=_get_shell, daemon=True).start()
+    stream = client.chat.completions.create(
         model=MODEL,
         temperature=TEMPERATURE,
         messages=messages,
+        stream=True,
     )
-    content = resp.choices[0].message.content
-    data = json.loads(_extract_json(content))
+    parts = []
+    for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            parts.append(chunk.choices[0].delta.content)
+    content = "".join(parts)
+    block = _extract_json(content)
+    if ijson is not None and len(block) >= _LARGE_RESPONSE:
+        data = _parse_plan_large(block)
+    else:
+        data = _loads(block)
     if not isinstance(data.get("commands"), list):
         raise ValueError("No 'commands' array from model.")
+    if key is not None:
+        _plan_cache_put(key, (content, data))
+    if emb is not None:
+        if not use_cache:
+            # Force-refresh: drop stale entries this plan supersedes, or a
+            # later lookup could still prefer one of them.
+            _semantic_entries[:] = [
+                entry
+                for entry in _semantic_entries
+                if len(entry[0]) != len(emb)
+                or sum(a * b for a, b in zip(emb, entry[0])) <= _SEMANTIC_THRESHOLD
+            ]
+        _semantic_entries.append((emb, content, data))
+        _save_semantic_cache()
     messages.append({"role": "assistant", "content": content})
     return data
 
@@ -268,15 +722,59 @@ def assess_completion(messages: list) -> dict:
         messages=messages + [check],
     )
     content = resp.choices[0].message.content
-    data = json.loads(_extract_json(content))
+    data = _loads(_extract_json(content))
     messages.append({"role": "assistant", "content": content})
     return data
 
+# Prompt cost grows with every turn, so once the history exceeds the window
+# the oldest turns are folded into one short summary message.
+_HISTORY_WINDOW = 20
+_HISTORY_KEEP = 8  # recent messages kept verbatim
+
+def _compact_history(messages: list) -> None:
+    """Summarize old turns in place once the history exceeds the window.
+
+    Keeps the leading system messages and the most recent turns verbatim and
+    replaces everything in between with a single model-written summary, so
+    per-turn prompt cost stays bounded instead of growing with session length.
+    Leaves the history untouched if the summary call fails.
+    """
+    if len(messages) <= _HISTORY_WINDOW:
+        return
+    head = 0
+    while head < len(messages) and messages[head].get("role") == "system":
+        head += 1
+    cut = len(messages) - _HISTORY_KEEP
+    if cut <= head:
+        return
+    old = "\n".join(f"{m.get('role')}: {m.get('content')}" for m in messages[head:cut])
+    try:
+        resp = client.chat.completions.create(
+            model=MODEL,
+            temperature=TEMPERATURE,
+            messages=[
+                {
+                    "role": "user",
+                    "content": (
+                        "Summarize the following agent conversation in at most"
+                        " 300 tokens. Keep task goals, key findings, and the"
+                        " outcomes of commands that were run:\n\n" + old
+                    ),
+                }
+            ],
+        )
+        summary = resp.choices[0].message.content
+    except Exception:
+        return
+    messages[head:cut] = [
+        {"role": "system", "content": f"Summary of earlier turns: {summary}"}
+    ]
+
 # -------------------------- Main loop ----------------------------------------
 
 def main():
     print("AI Agent ready. Type a task (or 'exit').")
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    messages = list(BASE_MESSAGES)
     while True:
         try:
             task = input(">>> ").strip()
@@ -288,13 +786,35 @@ def main():
         if not task:
             continue
         try:
+            # A leading "!" forces a fresh model call, bypassing the caches.
+            use_cache = not task.startswith("!")
+            if not use_cache:
+                task = task[1:].lstrip()
             messages.append({"role": "user", "content": task})
-            plan = plan_commands(messages)
+            _compact_history(messages)
+            plan = plan_commands(messages, use_cache=use_cache)
             print("[AI]", plan.get("explanation", ""))
-            output = run_commands(plan["commands"])
+            groups = plan.get("parallel_groups")
+            # Every group must itself be a list: a flat list of strings would
+            # iterate each command's characters as separate commands.
+            if (
+                isinstance(groups, list)
+                and groups
+                and all(isinstance(g, list) for g in groups)
+            ):
+                output = run_parallel_groups(groups)
+            else:
+                output = run_commands(plan["commands"])
             if output.strip():
                 messages.append({"role": "user", "content": output})
-            result = assess_completion(messages)
+                result = assess_completion(messages)
+            else:
+                # the plan already carries the no-output verdict, so the
+                # separate assessment round-trip is unnecessary
+                result = {
+                    "done": bool(plan.get("done_if_no_output")),
+                    "summary": plan.get("summary", ""),
+                }
             if result.get("summary"):
                 print("[AI]", result["summary"])
             if result.get("done"):
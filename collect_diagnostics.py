@@ -20,38 +20,191 @@ failing.  This makes it safe to run the script on minimal distributions.
 from __future__ import annotations
 
 import argparse
+import atexit
 import datetime as _dt
+import heapq
 import os
+import shlex
 import shutil
+import socket
 import subprocess
+import tempfile
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import Iterable, List, Tuple
+from typing import Callable, Iterable, List, Tuple, Union
 
 # ------------------------------ Command catalog -------------------------------
 
-Command = Tuple[str, str]
+# Either a shell command string or a zero-argument callable returning the
+# output directly (used where a pure-Python probe beats spawning processes).
+CommandSpec = Union[str, Callable[[], str]]
+# (spec, description[, stderr_policy]); the policy is "capture" (default),
+# "discard", or "tail:N" to keep only the last N stderr lines -- ping and
+# traceroute against an unreachable network can emit hundreds of KB of
+# repeated errors otherwise.
+Command = Union[Tuple[CommandSpec, str], Tuple[CommandSpec, str, str]]
 
 
+# Capability probes walk $PATH via shutil.which and build_catalog() runs more
+# than once per invocation (argparse choices= calls it too), so memoize them;
+# capabilities don't change within the process lifetime.
+@lru_cache(maxsize=1)
 def _supports_systemctl() -> bool:
     """Return True when systemd/systemctl appears to be available."""
 
     return shutil.which("systemctl") is not None and Path("/run/systemd/system").exists()
 
 
+@lru_cache(maxsize=1)
 def _supports_docker() -> bool:
     """Return True when the Docker CLI is available."""
 
     return shutil.which("docker") is not None
 
 
+@lru_cache(maxsize=1)
 def _supports_podman() -> bool:
     return shutil.which("podman") is not None
 
 
+@lru_cache(maxsize=1)
 def _supports_kubectl() -> bool:
     return shutil.which("kubectl") is not None
 
 
+# Optional io_uring fast path for the /proc scan: batching the per-process
+# reads through one ring submission replaces hundreds of read(2) entries with
+# a handful of io_uring_enter calls.  Needs the liburing bindings and a
+# kernel >= 5.6; any failure permanently falls back to the serial path.
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+_URING_MIN_PIDS = 64  # not worth the ring setup below this
+_URING_BATCH = 256
+_uring_ok = liburing is not None
+
+
+def _read_procs_uring(pids: List[str]):
+    """Read /proc/<pid>/stat for many pids via batched io_uring submissions.
+
+    Returns {pid: bytes} or None (disabling itself) when the bindings
+    misbehave, so callers can fall back to the serial scan.
+    """
+
+    global _uring_ok
+    try:
+        ring = liburing.io_uring()
+        cqe = liburing.io_uring_cqe()
+        liburing.io_uring_queue_init(_URING_BATCH, ring, 0)
+    except Exception:
+        _uring_ok = False
+        return None
+    out: dict = {}
+    try:
+        for start in range(0, len(pids), _URING_BATCH):
+            batch = pids[start : start + _URING_BATCH]
+            fds, bufs = [], []
+            for idx, pid in enumerate(batch):
+                try:
+                    fd = os.open(f"/proc/{pid}/stat", os.O_RDONLY)
+                except OSError:
+                    continue  # process exited mid-scan
+                buf = bytearray(2048)
+                sqe = liburing.io_uring_get_sqe(ring)
+                liburing.io_uring_prep_read(sqe, fd, buf, len(buf), 0)
+                sqe.user_data = idx
+                fds.append((idx, pid, fd))
+                bufs.append((idx, buf))
+            if not fds:
+                continue
+            liburing.io_uring_submit(ring)
+            buf_map = dict(bufs)
+            pid_map = {idx: pid for idx, pid, _ in fds}
+            for _ in range(len(fds)):
+                liburing.io_uring_wait_cqe(ring, cqe)
+                if cqe.res > 0:
+                    idx = cqe.user_data
+                    out[pid_map[idx]] = bytes(buf_map[idx][: cqe.res])
+                liburing.io_uring_cqe_seen(ring, cqe)
+            for _, _, fd in fds:
+                os.close(fd)
+    except Exception:
+        _uring_ok = False
+        return None
+    finally:
+        try:
+            liburing.io_uring_queue_exit(ring)
+        except Exception:
+            pass
+    return out
+
+
+def _parse_stat(pid: str, stat: str):
+    """Parse one /proc/<pid>/stat line into (cpu_ticks, rss_pages, pid, comm)."""
+
+    try:
+        # comm may contain spaces/parens; fields resume after the last ')'
+        rpar = stat.rindex(")")
+        comm = stat[stat.index("(") + 1 : rpar]
+        fields = stat[rpar + 2 :].split()
+        cpu_ticks = int(fields[11]) + int(fields[12])  # utime + stime
+        rss_pages = int(fields[21])
+    except (ValueError, IndexError):
+        return None
+    return (cpu_ticks, rss_pages, int(pid), comm)
+
+
+def _scan_processes() -> List[Tuple[int, int, int, str]]:
+    """Collect (cpu_ticks, rss_pages, pid, comm) for every process in /proc."""
+
+    pids = [entry.name for entry in os.scandir("/proc") if entry.name.isdigit()]
+    raw = None
+    if _uring_ok and len(pids) >= _URING_MIN_PIDS:
+        raw = _read_procs_uring(pids)
+    if raw is None:
+        raw = {}
+        for pid in pids:
+            try:
+                with open(f"/proc/{pid}/stat", "rb") as fh:
+                    raw[pid] = fh.read()
+            except OSError:
+                continue  # process exited mid-scan
+    entries = []
+    for pid, data in raw.items():
+        parsed = _parse_stat(pid, data.decode("ascii", "replace"))
+        if parsed is not None:
+            entries.append(parsed)
+    return entries
+
+
+def _render_top(entries: List[Tuple[int, int, int, str]]) -> str:
+    tick = os.sysconf("SC_CLK_TCK") or 100
+    page_kb = os.sysconf("SC_PAGE_SIZE") // 1024
+    lines = [f"{'PID':>7} {'CPU(s)':>9} {'RSS(kB)':>10} COMMAND"]
+    for cpu_ticks, rss_pages, pid, comm in entries:
+        lines.append(
+            f"{pid:>7} {cpu_ticks / tick:>9.1f} {rss_pages * page_kb:>10} {comm}"
+        )
+    return "\n".join(lines)
+
+
+def _top_cpu_processes() -> str:
+    """Top 20 processes by CPU time via a direct /proc scan (no ps/head spawn)."""
+
+    return _render_top(heapq.nlargest(20, _scan_processes()))
+
+
+def _top_memory_processes() -> str:
+    """Top 20 processes by resident memory via a direct /proc scan."""
+
+    return _render_top(heapq.nlargest(20, _scan_processes(), key=lambda e: e[1]))
+
+
 def _common_commands() -> List[Command]:
     """Commands always worth running regardless of the host environment."""
 
@@ -64,8 +217,8 @@ def _common_commands() -> List[Command]:
         ("id", "Current user identity"),
         ("df -h", "Disk usage"),
         ("free -h", "Memory usage"),
-        ("ps aux --sort=-%cpu | head -n 20", "Top processes by CPU"),
-        ("ps aux --sort=-%mem | head -n 20", "Top processes by memory"),
+        (_top_cpu_processes, "Top processes by CPU"),
+        (_top_memory_processes, "Top processes by memory"),
         ("journalctl -p err -n 200", "Last 200 error-level journal entries"),
         ("dmesg | tail -n 200", "Kernel ring buffer tail"),
     ]
@@ -95,10 +248,10 @@ def _network_commands() -> List[Command]:
         ("ss -tulpn", "Listening sockets"),
         ("resolvectl status", "Resolver configuration"),
         ("cat /etc/resolv.conf", "Resolver fallback"),
-        ("ping -c 4 8.8.8.8", "Ping external DNS (8.8.8.8)"),
-        ("ping -c 4 1.1.1.1", "Ping external DNS (1.1.1.1)"),
-        ("ping -c 4 localhost", "Ping localhost"),
-        ("traceroute 8.8.8.8", "Traceroute to 8.8.8.8"),
+        ("ping -c 4 8.8.8.8", "Ping external DNS (8.8.8.8)", "tail:10"),
+        ("ping -c 4 1.1.1.1", "Ping external DNS (1.1.1.1)", "tail:10"),
+        ("ping -c 4 localhost", "Ping localhost", "tail:10"),
+        ("traceroute 8.8.8.8", "Traceroute to 8.8.8.8", "tail:10"),
         ("systemd-resolve --statistics", "systemd-resolved stats"),
     ]
     return cmds
@@ -183,52 +336,231 @@ def resolve_output_path(output: str | None) -> Path:
     return Path.cwd() / f"diagnostics-{ts}.log"
 
 
-def run_command(cmd: str) -> subprocess.CompletedProcess:
+def _command_env() -> dict:
     env = os.environ.copy()
     if not env.get("PATH"):
         env["PATH"] = "/usr/local/sbin:/usr/local/bin:/usr/sbin:/usr/bin:/sbin:/bin"
-    return subprocess.run(
-        cmd,
-        shell=True,
-        check=False,
-        capture_output=True,
-        text=True,
-        env=env,
+    return env
+
+
+class _ShellWorker:
+    """A long-lived bash process fed commands over stdin.
+
+    Spawning a fresh shell per command costs 5-20 ms of fork/exec each, which
+    adds up over a ~40-command catalog.  Output is delimited with per-command
+    sentinel markers; stderr is drained on a helper thread so neither pipe can
+    fill up and deadlock.
+    """
+
+    def __init__(self) -> None:
+        self._proc = subprocess.Popen(
+            ["bash"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            env=_command_env(),
+        )
+
+    def alive(self) -> bool:
+        return self._proc.poll() is None
+
+    def close(self) -> None:
+        try:
+            self._proc.stdin.close()
+        except Exception:
+            pass
+        self._proc.terminate()
+        self._proc.wait()
+
+    def run(self, cmd: str) -> subprocess.CompletedProcess:
+        end = f"__DIAG_END_{uuid.uuid4().hex}__"
+        stderr_lines: List[str] = []
+
+        def _drain_stderr() -> None:
+            # The sentinel can land mid-line when the command's stderr lacks a
+            # trailing newline, so split on find like the stdout loop does.
+            for line in self._proc.stderr:
+                idx = line.find(end)
+                if idx >= 0:
+                    if idx:
+                        stderr_lines.append(line[:idx])
+                    break
+                stderr_lines.append(line)
+
+        drainer = threading.Thread(target=_drain_stderr)
+        drainer.start()
+        self._proc.stdin.write(f"{cmd}\n")
+        self._proc.stdin.write(f"printf '{end} %s\\n' $?\n")
+        self._proc.stdin.write(f"printf '{end}\\n' >&2\n")
+        self._proc.stdin.flush()
+
+        stdout_lines: List[str] = []
+        returncode = None
+        for line in self._proc.stdout:
+            idx = line.find(end)
+            if idx >= 0:
+                if idx:
+                    stdout_lines.append(line[:idx])
+                returncode = int(line[idx + len(end):])
+                break
+            stdout_lines.append(line)
+        drainer.join()
+        if returncode is None:
+            raise RuntimeError("shell worker exited before finishing command")
+        return subprocess.CompletedProcess(
+            cmd, returncode, "".join(stdout_lines), "".join(stderr_lines)
+        )
+
+
+# One worker per executor thread; capability probes and catalog commands all
+# funnel through run_command, so each thread pays the shell spawn cost once.
+_worker_local = threading.local()
+_workers: List[_ShellWorker] = []
+
+
+@atexit.register
+def _close_workers() -> None:
+    for worker in _workers:
+        worker.close()
+
+
+# Commands whose output can be big enough to matter skip the worker's pipes:
+# the kernel writes their stdout straight to a temp file, which is read back
+# and decoded exactly once instead of round-tripping chunks through Python.
+_SPOOL_PREFIXES = ("journalctl", "dmesg")
+
+
+def _spawn_args(cmd: str):
+    """Return (args, shell) for subprocess.
+
+    Commands without shell features run as a plain argv with shell=False, so
+    CPython takes its posix_spawn fast path instead of forking a bash that
+    forks the real binary.
+    """
+    if not cmd.strip() or any(c in cmd for c in "|&;<>$`*?~(){}[]'\"\\\n"):
+        return cmd, True
+    return shlex.split(cmd), False
+
+
+def _run_spooled(cmd: str) -> subprocess.CompletedProcess:
+    args, shell = _spawn_args(cmd)
+    try:
+        with tempfile.TemporaryFile() as spool:
+            result = subprocess.run(
+                args,
+                shell=shell,
+                check=False,
+                stdout=spool,
+                stderr=subprocess.PIPE,
+                env=_command_env(),
+            )
+            spool.seek(0)
+            stdout = spool.read().decode(errors="replace")
+    except FileNotFoundError:
+        # shell=True reports a missing binary as exit 127; mirror that
+        return subprocess.CompletedProcess(cmd, 127, "", f"{cmd}: command not found")
+    return subprocess.CompletedProcess(
+        cmd, result.returncode, stdout, result.stderr.decode(errors="replace")
     )
 
 
+def run_command(cmd: str) -> subprocess.CompletedProcess:
+    if cmd.lstrip().startswith(_SPOOL_PREFIXES):
+        return _run_spooled(cmd)
+    worker = getattr(_worker_local, "shell", None)
+    if worker is None or not worker.alive():
+        try:
+            worker = _ShellWorker()
+            _workers.append(worker)
+        except OSError:
+            worker = None
+        _worker_local.shell = worker
+    if worker is not None:
+        try:
+            return worker.run(cmd)
+        except Exception:
+            # Worker died mid-command (e.g. the command killed the shell);
+            # fall back to a one-shot shell and respawn on the next call.
+            _worker_local.shell = None
+    args, shell = _spawn_args(cmd)
+    try:
+        return subprocess.run(
+            args,
+            shell=shell,
+            check=False,
+            capture_output=True,
+            text=True,
+            env=_command_env(),
+        )
+    except FileNotFoundError:
+        return subprocess.CompletedProcess(cmd, 127, "", f"{cmd}: command not found")
+
+
 def write_header(fp, output_path: Path, sections: Iterable[str]) -> None:
     fp.write("# Diagnostic Snapshot\n")
     fp.write(f"# Generated: {timestamp()}\n")
     fp.write(f"# Output file: {output_path}\n")
     fp.write(f"# Sections: {', '.join(sections)}\n")
-    fp.write("# Host: {}\n".format(Path('/etc/hostname').read_text().strip() if Path('/etc/hostname').exists() else 'unknown'))
+    # gethostname is a single uname(2) call; no need to open /etc/hostname
+    fp.write("# Host: {}\n".format(socket.gethostname() or "unknown"))
     fp.write("\n")
 
 
-def log_command(fp, section: str, command: Command) -> None:
-    cmd, description = command
-    fp.write(f"## [{section}] {description}\n")
-    fp.write(f"$ {cmd}\n")
+def _spec_label(cmd: CommandSpec) -> str:
+    return f"[python] {cmd.__name__}" if callable(cmd) else cmd
+
+
+def _apply_stderr_policy(stderr: str, policy: str) -> str:
+    if policy == "discard":
+        return ""
+    if policy.startswith("tail:"):
+        n = int(policy.split(":", 1)[1])
+        lines = stderr.splitlines(keepends=True)
+        if len(lines) > n:
+            return f"[stderr truncated to last {n} lines]\n" + "".join(lines[-n:])
+    return stderr
+
+
+def render_command(section: str, command: Command) -> str:
+    """Run a command and return its fully formatted log block.
+
+    Returning a string instead of writing to the log directly lets commands
+    run on worker threads while the log is still written in catalog order.
+    """
+    cmd, description = command[0], command[1]
+    stderr_policy = command[2] if len(command) > 2 else "capture"
+    parts = [f"## [{section}] {description}\n", f"$ {_spec_label(cmd)}\n"]
     start = timestamp()
-    result = run_command(cmd)
-    fp.write(f"- timestamp: {start}\n")
-    fp.write(f"- exit_code: {result.returncode}\n")
-    stdout = result.stdout.rstrip()
-    stderr = result.stderr.rstrip()
+    if callable(cmd):
+        try:
+            stdout, stderr, returncode = cmd(), "", 0
+        except Exception as exc:
+            stdout, stderr, returncode = "", str(exc), 1
+    else:
+        result = run_command(cmd)
+        stdout, stderr, returncode = result.stdout, result.stderr, result.returncode
+    stderr = _apply_stderr_policy(stderr, stderr_policy)
+    parts.append(f"- timestamp: {start}\n")
+    parts.append(f"- exit_code: {returncode}\n")
+    stdout = stdout.rstrip()
+    stderr = stderr.rstrip()
     if stdout:
-        fp.write("--- stdout ---\n")
-        fp.write(stdout + "\n")
+        parts.append("--- stdout ---\n")
+        parts.append(stdout + "\n")
     else:
-        fp.write("--- stdout: <empty> ---\n")
+        parts.append("--- stdout: <empty> ---\n")
     if stderr:
-        fp.write("--- stderr ---\n")
-        fp.write(stderr + "\n")
+        parts.append("--- stderr ---\n")
+        parts.append(stderr + "\n")
     else:
-        fp.write("--- stderr: <empty> ---\n")
-    fp.write("\n")
+        parts.append("--- stderr: <empty> ---\n")
+    parts.append("\n")
+    return "".join(parts)
 
 
+@lru_cache(maxsize=1)
 def available_sections() -> List[str]:
     return [name for name, _ in build_catalog()]
 
@@ -266,14 +598,39 @@ def collect(output: Path, selected_sections: Iterable[str] | None) -> Path:
     catalog = build_catalog()
     filtered = filter_sections(catalog, selected_sections)
     ensure_parent(output)
+    total = sum(len(commands) for _, commands in filtered)
     with output.open("w", encoding="utf-8") as fp:
         write_header(fp, output, [name for name, _ in filtered])
-        for section, commands in filtered:
-            if not commands:
-                fp.write(f"## [{section}] No commands available on this system.\n\n")
-                continue
-            for command in commands:
-                log_command(fp, section, command)
+        # The commands are independent and mostly wait on I/O (ping,
+        # traceroute, apt-get -s, ...), so run them on worker threads and
+        # write the results in catalog order as each one finishes.
+        with ThreadPoolExecutor(max_workers=min(16, total) or 1) as executor:
+            # The same probe can appear in several selected sections; run it
+            # once and point later occurrences at the first section's output.
+            seen: dict = {}
+            plan: dict = {}
+            for section, commands in filtered:
+                entries = []
+                for command in commands:
+                    spec = command[0]
+                    if spec in seen:
+                        entries.append((command, seen[spec], None))
+                    else:
+                        future = executor.submit(render_command, section, command)
+                        seen[spec] = section
+                        entries.append((command, None, future))
+                plan[section] = entries
+            for section, commands in filtered:
+                if not commands:
+                    fp.write(f"## [{section}] No commands available on this system.\n\n")
+                    continue
+                for command, ref_section, future in plan[section]:
+                    if future is None:
+                        fp.write(f"## [{section}] {command[1]}\n")
+                        fp.write(f"$ {_spec_label(command[0])}\n")
+                        fp.write(f"(see [{ref_section}] earlier)\n\n")
+                    else:
+                        fp.write(future.result())
     return output
 
 
@@ -4,32 +4,31 @@
 from __future__ import annotations
 
 from pathlib import Path
-import re
 import agent
+from run_scenarios import build_messages
+from scenarios_loader import SCENARIOS_FILE, get_executor, load_all
 
-SCENARIOS_FILE = Path(__file__).with_name("SCENARIOS.md")
 SCENARIO_NUMBERS = [28, 29, 33, 51, 52]
 
 
 def load_selected_scenarios(path: Path, numbers: list[int]) -> list[str]:
     """Load scenarios by their list numbers."""
-    mapping: dict[int, str] = {}
-    for line in path.read_text().splitlines():
-        match = re.match(r"(\d+)\.\s+(.*)", line)
-        if match:
-            mapping[int(match.group(1))] = match.group(2).strip()
+    mapping = load_all(path)
     return [mapping[n] for n in numbers if n in mapping]
 
 
 def run() -> None:
     scenarios = load_selected_scenarios(SCENARIOS_FILE, SCENARIO_NUMBERS)
-    for idx, desc in enumerate(scenarios, 1):
+    # Same plan-concurrent/execute-serial split as run_scenarios, sharing its
+    # executor so back-to-back runner invocations reuse one pool.
+    executor = get_executor()
+    futures = [
+        executor.submit(agent.plan_commands, build_messages(desc)) for desc in scenarios
+    ]
+    for idx, (desc, future) in enumerate(zip(scenarios, futures), 1):
         print(f"\n=== Scenario {idx}: {desc} ===")
-        messages = [{"role": "system", "content": agent.SYSTEM_PROMPT}]
-        task = f"Investigate and resolve: {desc}"
-        messages.append({"role": "user", "content": task})
         try:
-            plan = agent.plan_commands(messages)
+            plan = future.result()
             print("[AI]", plan.get("explanation", ""))
             output = agent.run_commands(plan["commands"])
             if output.strip():
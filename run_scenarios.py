@@ -8,35 +8,40 @@ printed so humans can evaluate performance.
 
 from __future__ import annotations
 
-import re
 from pathlib import Path
 import sys
 import agent
+from scenarios_loader import SCENARIOS_FILE, get_executor, load_all
 
-SCENARIOS_FILE = Path(__file__).with_name("SCENARIOS.md")
 DEFAULT_COUNT = 5
 
 
 def load_scenarios(path: Path = SCENARIOS_FILE) -> list[str]:
     """Extract scenario descriptions from SCENARIOS.md."""
-    scenarios: list[str] = []
-    for line in path.read_text().splitlines():
-        match = re.match(r"\d+\.\s+(.*)", line)
-        if match:
-            scenarios.append(match.group(1).strip())
-    return scenarios
+    return list(load_all(path).values())
+
+
+def build_messages(desc: str) -> list[dict]:
+    """Wrap a scenario description as a task for the agent."""
+    messages = list(agent.BASE_MESSAGES)
+    messages.append({"role": "user", "content": f"Investigate and resolve: {desc}"})
+    return messages
 
 
 def run(n: int = DEFAULT_COUNT) -> None:
     scenarios = load_scenarios()[:n]
-    for idx, desc in enumerate(scenarios, 1):
+    batches = [build_messages(desc) for desc in scenarios]
+    # Plan scenarios concurrently -- each call is seconds of pure network
+    # wait -- but cap the in-flight API requests at 8.  Execution drains the
+    # futures in input order and stays serial, since commands mutate host
+    # state; total time is roughly max(plan) + sum(exec) instead of the sum
+    # of both.
+    executor = get_executor()
+    futures = [executor.submit(agent.plan_commands, messages) for messages in batches]
+    for idx, (desc, future) in enumerate(zip(scenarios, futures), 1):
         print(f"\n=== Scenario {idx}: {desc} ===")
-        messages = [{"role": "system", "content": agent.SYSTEM_PROMPT}]
-        # Wrap scenario as a task for the agent
-        task = f"Investigate and resolve: {desc}"
-        messages.append({"role": "user", "content": task})
         try:
-            plan = agent.plan_commands(messages)
+            plan = future.result()
             print("[AI]", plan.get("explanation", ""))
             output = agent.run_commands(plan["commands"])
             if output.strip():
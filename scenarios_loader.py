@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Shared, cached parser for SCENARIOS.md.
+
+Both scenario runners need the numbered scenario descriptions.  The parse is
+memoized on the file's modification time, so repeated invocations in the same
+process (e.g. when the runner modules are imported by a harness) skip the
+re-read and the per-line regex sweep.
+"""
+
+from __future__ import annotations
+
+import atexit
+import functools
+import re
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+SCENARIOS_FILE = Path(__file__).with_name("SCENARIOS.md")
+
+# Multiline so one C-level findall sweep pulls every (number, description)
+# pair without splitlines allocating a string per line.
+_SCENARIO_RE = re.compile(r"^(\d+)\.\s+(.*?)\s*$", re.M)
+
+
+@functools.lru_cache(maxsize=4)
+def _parse(path: str, mtime_ns: int) -> dict[int, str]:
+    return {int(n): d for n, d in _SCENARIO_RE.findall(Path(path).read_text())}
+
+
+def load_all(path: Path = SCENARIOS_FILE) -> dict[int, str]:
+    """Return {number: description} for every scenario in the file."""
+    return _parse(str(path), path.stat().st_mtime_ns)
+
+
+_EXECUTOR: ThreadPoolExecutor | None = None
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Process-wide planning pool shared by the scenario runners.
+
+    Created lazily and shut down at interpreter exit, so runners composed in
+    one process reuse the same threads instead of each spawning and tearing
+    down their own pool.
+    """
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=8)
+        atexit.register(_EXECUTOR.shutdown)
+    return _EXECUTOR